@@ -0,0 +1,77 @@
+"""Worker for the Postgres-backed webhook queue.
+
+When REDIS_URL is not configured the endpoint inserts payloads into the
+webhook_events table (migration 003); run one or more of these processes to
+drain it. Claiming rows with FOR UPDATE SKIP LOCKED lets workers pull
+batches in parallel without fighting over the head of the queue.
+
+Usage:
+    python db_worker.py
+"""
+import logging
+import time
+
+from tasks import DatabaseManager, process_jira_event, start_flusher
+from logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 0.5
+ERROR_BACKOFF_SECONDS = 5.0
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 3
+
+
+def claim_and_process(db_manager):
+    """Claims a batch of unprocessed events, runs them, and marks them done.
+    Returns the number of events claimed."""
+    with db_manager as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT id, payload, attempts FROM webhook_events "
+                "WHERE processed_at IS NULL AND attempts < %s ORDER BY id "
+                "FOR UPDATE SKIP LOCKED LIMIT %s",
+                (MAX_ATTEMPTS, BATCH_SIZE)
+            )
+            rows = cur.fetchall()
+            for event_id, payload, attempts in rows:
+                try:
+                    process_jira_event(payload)
+                except Exception:
+                    # Transient failures (pool exhaustion, Postgres restart,
+                    # network blips) get retried on a later poll; only after
+                    # MAX_ATTEMPTS is a payload treated as poisonous and
+                    # left behind with processed_at still NULL.
+                    cur.execute("UPDATE webhook_events SET attempts = attempts + 1 WHERE id = %s", (event_id,))
+                    if attempts + 1 >= MAX_ATTEMPTS:
+                        logger.exception("Giving up on webhook event %d after %d attempts", event_id, attempts + 1)
+                    else:
+                        logger.exception("Error processing webhook event %d (attempt %d)", event_id, attempts + 1)
+                    continue
+                cur.execute("UPDATE webhook_events SET processed_at = NOW(), attempts = attempts + 1 WHERE id = %s", (event_id,))
+            conn.commit()
+            return len(rows)
+
+
+def main():
+    db_manager = DatabaseManager()
+    # This process is long-lived, so batching across events is safe here.
+    start_flusher()
+    logger.info("DB-backed webhook worker started.")
+    while True:
+        try:
+            claimed = claim_and_process(db_manager)
+        except Exception:
+            # The claiming connection itself failed (e.g. Postgres restart).
+            # The pool discards broken connections on exit, so back off and
+            # retry on a fresh one instead of letting the worker die.
+            logger.exception("Webhook worker poll failed; retrying in %.0fs", ERROR_BACKOFF_SECONDS)
+            time.sleep(ERROR_BACKOFF_SECONDS)
+            continue
+        if claimed == 0:
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""Process-wide logging setup for the webhook server and worker.
+
+Records are pushed onto an unbounded queue and written to stderr by a
+background QueueListener thread, so request and worker threads never block
+on a slow stdout/stderr sink (Docker log drivers, PaaS log shippers)."""
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+_CONFIGURED = False
+
+
+def setup_logging():
+    global _CONFIGURED
+    if _CONFIGURED:
+        return
+    log_queue = queue.Queue(-1)
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+    QueueListener(log_queue, handler).start()
+    _CONFIGURED = True
@@ -0,0 +1,5 @@
+-- Adds parent linkage to the mapping table so deleting an Epic can cascade
+-- to its children in a single DELETE instead of asking Jira for the child
+-- issues over the network.
+ALTER TABLE jira_cloobot_mapping ADD COLUMN IF NOT EXISTS parent_jira_key TEXT;
+CREATE INDEX IF NOT EXISTS ix_jcm_parent_key ON jira_cloobot_mapping (parent_jira_key);
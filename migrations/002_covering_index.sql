@@ -0,0 +1,8 @@
+-- Makes lookups on jira_issue_key index-only: the btree carries the ids the
+-- handlers read, so matching a webhook never has to visit the heap, and
+-- deletes over ANY(key list) stay O(log N) as the table grows.
+-- Note: CREATE INDEX CONCURRENTLY cannot run inside a transaction block;
+-- apply this file with psql autocommit.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_jcm_key_incl
+    ON jira_cloobot_mapping (jira_issue_key)
+    INCLUDE (cloobot_item_id, jira_issue_id);
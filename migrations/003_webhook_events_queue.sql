@@ -0,0 +1,12 @@
+-- Postgres-backed webhook queue used when no Redis/RQ is configured: the
+-- endpoint INSERTs payloads and db_worker.py drains them with
+-- FOR UPDATE SKIP LOCKED, so any number of workers pull batches in
+-- parallel without contending on the head row.
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id BIGSERIAL PRIMARY KEY,
+    payload JSONB NOT NULL,
+    enqueued_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    processed_at TIMESTAMPTZ,
+    attempts INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_webhook_events_pending ON webhook_events (id) WHERE processed_at IS NULL;
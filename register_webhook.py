@@ -0,0 +1,63 @@
+"""One-time deploy script: registers the Jira webhook scoped to the events
+this server actually handles, optionally restricted by a JQL filter, so Jira
+stops delivering irrelevant events in the first place.
+
+Usage:
+    WEBHOOK_URL=https://<host>/webhook/jira JIRA_WEBHOOK_JQL='project in (ABC, XYZ)' python register_webhook.py
+"""
+import os
+import sys
+import base64
+import requests
+
+from tasks import HANDLED_EVENTS
+
+
+JIRA_CONFIG = {
+    'base_url': os.environ.get('JIRA_BASE_URL'),
+    'email': os.environ.get('JIRA_EMAIL'),
+    'api_token': os.environ.get('JIRA_API_TOKEN'),
+}
+
+
+def register_webhook():
+    webhook_url = os.environ.get('WEBHOOK_URL')
+    if not webhook_url:
+        raise ValueError("FATAL: WEBHOOK_URL environment variable not set.")
+    if not all([JIRA_CONFIG['base_url'], JIRA_CONFIG['email'], JIRA_CONFIG['api_token']]):
+        raise ValueError("FATAL: Server environment variables (JIRA_BASE_URL, JIRA_EMAIL, JIRA_API_TOKEN) are not set.")
+
+    auth_string = f"{JIRA_CONFIG['email']}:{JIRA_CONFIG['api_token']}"
+    auth_b64 = base64.b64encode(auth_string.encode('ascii')).decode('ascii')
+    headers = {
+        'Authorization': f'Basic {auth_b64}',
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip',
+    }
+
+    body = {
+        'name': 'jira-cloobot mapping sync',
+        'url': webhook_url,
+        'events': sorted(HANDLED_EVENTS),
+        'excludeBody': False,
+    }
+    jql_filter = os.environ.get('JIRA_WEBHOOK_JQL')
+    if jql_filter:
+        body['filters'] = {'issue-related-events-section': jql_filter}
+
+    response = requests.post(
+        f"{JIRA_CONFIG['base_url']}/rest/webhooks/1.0/webhook",
+        headers=headers, json=body, timeout=10,
+    )
+    if response.status_code in (200, 201):
+        print(f"Webhook registered for events: {', '.join(body['events'])}")
+        if jql_filter:
+            print(f"Scoped to JQL: {jql_filter}")
+    else:
+        print(f"ERROR: Webhook registration failed with {response.status_code}: {response.text}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    register_webhook()
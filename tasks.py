@@ -0,0 +1,297 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values, Json
+
+from logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Shared across all requests so each webhook reuses a warm connection instead
+# of paying the full TCP + TLS + auth handshake against Postgres every time.
+POOL = None
+
+
+def get_pool():
+    global POOL
+    if POOL is None:
+        conn_string = os.environ.get('DATABASE_URL')
+        if not conn_string:
+            raise ValueError("FATAL: DATABASE_URL environment variable not set.")
+        POOL = ThreadedConnectionPool(
+            minconn=int(os.environ.get('PG_POOL_MIN', 2)),
+            maxconn=int(os.environ.get('PG_POOL_MAX', 20)),
+            dsn=conn_string,
+        )
+    return POOL
+
+
+# Hot single-row statements are PREPAREd once per pooled connection so
+# Postgres skips the parse/plan step on every webhook; the methods below
+# EXECUTE them by name.
+PREPARED_STATEMENTS = {
+    'delete_mappings': (
+        "PREPARE delete_mappings(text[]) AS "
+        "DELETE FROM jira_cloobot_mapping WHERE jira_issue_key = ANY($1)"
+    ),
+    'delete_cascade': (
+        "PREPARE delete_cascade(text) AS "
+        "DELETE FROM jira_cloobot_mapping WHERE jira_issue_key = $1 OR parent_jira_key = $1 "
+        "RETURNING jira_issue_key"
+    ),
+}
+
+
+def prepare_statements(conn):
+    """Prepares the hot statements on a connection if not already present.
+    Pooled connections outlive requests, so this usually does nothing."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT name FROM pg_prepared_statements")
+        existing = {row[0] for row in cur.fetchall()}
+        for name, statement in PREPARED_STATEMENTS.items():
+            if name not in existing:
+                cur.execute(statement)
+    conn.commit()
+
+
+class DatabaseManager:
+    """A simple connection manager for the webhook, backed by a shared pool.
+
+    The context manager is reentrant: nesting `with` blocks reuses the same
+    pooled connection, so a handler can wrap several method calls in one
+    checkout instead of going back to the pool for each statement."""
+    def __init__(self):
+        self.conn_string = os.environ.get('DATABASE_URL')
+        if not self.conn_string:
+            raise ValueError("FATAL: DATABASE_URL environment variable not set.")
+        self.conn = None
+        self._depth = 0
+
+    def __enter__(self):
+        if self.conn is None:
+            try:
+                self.conn = get_pool().getconn()
+                self.conn.autocommit = False
+                prepare_statements(self.conn)
+            except psycopg2.OperationalError as e:
+                logger.error("Error connecting to database: %s", e)
+                raise
+        self._depth += 1
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if self._depth == 0 and self.conn:
+            # Broken connections are discarded instead of going back in the pool.
+            get_pool().putconn(self.conn, close=exc_type is not None)
+            self.conn = None
+
+    def update_mapping_timestamps(self, rows):
+        """Applies buffered (jira_issue_key, updated_at) pairs in a single
+        batched UPDATE."""
+        if not rows: return
+        with self as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    "UPDATE jira_cloobot_mapping m SET updated_at = v.ts FROM (VALUES %s) AS v(key, ts) WHERE m.jira_issue_key = v.key",
+                    rows
+                )
+                conn.commit()
+
+    def delete_mapping(self, jira_keys_to_delete):
+        """Deletes one or more mapping records from the database."""
+        if not jira_keys_to_delete: return
+        with self as conn:
+            with conn.cursor() as cur:
+                # ANY over a list keeps one plan for every cardinality and
+                # avoids the IN %s single-element tuple pitfall.
+                cur.execute("EXECUTE delete_mappings(%s)", (list(jira_keys_to_delete),))
+                conn.commit()
+                logger.info("DB Records Deleted: Mappings for %s deleted.", ", ".join(jira_keys_to_delete))
+
+    def insert_mappings_bulk(self, rows):
+        """Inserts buffered (cloobot_item_id, jira_issue_id, jira_issue_key,
+        parent_jira_key) rows in one statement; duplicate keys are ignored."""
+        if not rows: return
+        with self as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    "INSERT INTO jira_cloobot_mapping (cloobot_item_id, jira_issue_id, jira_issue_key, parent_jira_key) VALUES %s ON CONFLICT (jira_issue_key) DO NOTHING",
+                    rows, page_size=500
+                )
+                conn.commit()
+
+    def delete_mapping_cascade(self, jira_key):
+        """Deletes the mapping for an issue and for any issues parented to it
+        (e.g. an Epic's children) in a single statement."""
+        with self as conn:
+            with conn.cursor() as cur:
+                cur.execute("EXECUTE delete_cascade(%s)", (jira_key,))
+                deleted_keys = [row[0] for row in cur.fetchall()]
+                conn.commit()
+                if deleted_keys:
+                    logger.info("DB Records Deleted: Mappings for %s deleted.", ", ".join(deleted_keys))
+                return deleted_keys
+
+
+IST = ZoneInfo('Asia/Kolkata')
+
+# Write-behind buffers: new-mapping rows are queued and timestamp touches
+# are coalesced per issue key, then flushed as batched statements, so an
+# edit storm or a project import costs one transaction per flush interval
+# instead of one per event. Jira often emits several issue_updated events
+# within milliseconds for one save; coalescing keeps only the latest
+# timestamp per key within the window.
+INSERT_BUFFER = queue.Queue()
+PENDING_UPDATES = {}
+PENDING_UPDATES_LOCK = threading.Lock()
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('FLUSH_INTERVAL', 0.2))
+FLUSH_MAX_BATCH = 500
+
+
+def buffer_update(jira_key):
+    with PENDING_UPDATES_LOCK:
+        PENDING_UPDATES[jira_key] = datetime.now(IST).replace(tzinfo=None)
+
+
+def _drain(buffer):
+    rows = []
+    while len(rows) < FLUSH_MAX_BATCH:
+        try:
+            rows.append(buffer.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+
+# Serializes whole flushes so a handler flushing ahead of a delete cannot
+# interleave with a background flush already in flight.
+_FLUSH_LOCK = threading.Lock()
+
+
+def flush_buffers(db_manager):
+    """Drains both buffers into batched statements."""
+    with _FLUSH_LOCK:
+        inserts = _drain(INSERT_BUFFER)
+        with PENDING_UPDATES_LOCK:
+            updates = list(PENDING_UPDATES.items())
+            PENDING_UPDATES.clear()
+        if not inserts and not updates:
+            return
+        with db_manager:
+            db_manager.insert_mappings_bulk(inserts)
+            db_manager.update_mapping_timestamps(updates)
+        logger.info("Flushed %d buffered insert(s), %d coalesced update(s).", len(inserts), len(updates))
+
+
+def _flusher_loop():
+    db_manager = DatabaseManager()
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        try:
+            flush_buffers(db_manager)
+        except Exception:
+            logger.exception("Error flushing write-behind buffers")
+
+
+_FLUSHER_STARTED = False
+_FLUSHER_LOCK = threading.Lock()
+
+
+def start_flusher():
+    """Starts the background flusher thread. Only long-lived worker
+    processes (db_worker) should call this; RQ work-horses exit right after
+    each job, so process_jira_event flushes synchronously for them instead."""
+    global _FLUSHER_STARTED
+    with _FLUSHER_LOCK:
+        if not _FLUSHER_STARTED:
+            threading.Thread(target=_flusher_loop, daemon=True, name='write-behind-flusher').start()
+            _FLUSHER_STARTED = True
+
+
+def _on_create(data, db_manager):
+    issue_data = data.get('issue', {})
+    jira_key = issue_data.get('key')
+    jira_issue_id = issue_data.get('id')
+    parent_jira_key = issue_data.get('fields', {}).get('parent', {}).get('key')
+
+    cloobot_id_placeholder = f"JIRA_CREATED_{jira_key}"
+    INSERT_BUFFER.put((cloobot_id_placeholder, str(jira_issue_id), str(jira_key), parent_jira_key))
+    logger.info("New issue created in Jira. Queued for mapping table.")
+
+
+def _on_update(data, db_manager):
+    jira_key = data.get('issue', {}).get('key')
+    buffer_update(jira_key)
+    changelog = data.get('changelog', {})
+    if changelog and 'items' in changelog:
+        for item in changelog['items']:
+            if item.get('field', '').lower() == 'summary':
+                logger.info("Issue Renamed: from '%s' to '%s'", item.get('fromString'), item.get('toString'))
+    logger.info("Simulating update to Cloobot item...")
+
+
+def _on_delete(data, db_manager):
+    jira_key = data.get('issue', {}).get('key')
+    # A create or update for this issue (or its children) may still sit in
+    # the write-behind buffers; land them first so a later flush cannot
+    # resurrect a row the cascade below just deleted.
+    flush_buffers(db_manager)
+    # parent_jira_key lets Postgres fan the delete out to an Epic's
+    # children itself; no JQL round-trip to Jira needed.
+    db_manager.delete_mapping_cascade(jira_key)
+    logger.info("Simulating deletion in Cloobot...")
+
+
+HANDLERS = {
+    'jira:issue_created': _on_create,
+    'jira:issue_updated': _on_update,
+    'jira:issue_deleted': _on_delete,
+}
+
+# The only webhook events this integration acts on; anything else is
+# dropped at the HTTP layer and excluded from the webhook registration.
+HANDLED_EVENTS = frozenset(HANDLERS)
+
+
+def enqueue_webhook_event(data):
+    """Inserts a webhook payload into the Postgres-backed queue drained by
+    db_worker.py; used when no Redis queue is configured."""
+    db_manager = DatabaseManager()
+    with db_manager as conn:
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO webhook_events (payload) VALUES (%s)", (Json(data),))
+            conn.commit()
+
+
+def process_jira_event(data):
+    """Processes a single Jira webhook payload. Runs in an RQ worker process,
+    or inline in the web process when no queue is configured."""
+    event_type = data.get('webhookEvent')
+    jira_key = data.get('issue', {}).get('key')
+
+    logger.info("Processing event '%s' for Jira issue: %s", event_type, jira_key)
+
+    handler = HANDLERS.get(event_type)
+    if handler is None:
+        return
+
+    db_manager = DatabaseManager()
+
+    # One pool checkout for the whole event; the handler's calls share it.
+    with db_manager:
+        handler(data, db_manager)
+        # RQ forks a work-horse per job and exits as soon as this function
+        # returns, so unless a long-lived worker runs the background
+        # flusher, buffered writes must land before the job is handed back.
+        if not _FLUSHER_STARTED:
+            flush_buffers(db_manager)